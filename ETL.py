@@ -1,12 +1,132 @@
 import pandas as pd
+import csv
 import os
 import time
 import logging
+import threading
+import multiprocessing as mp
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
 
 # 配置全局日志，格式包含时间和消息内容
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# 源数据时间戳格式，与 generate_events.py 输出一致
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# 定义允许的事件类型和设备类型集合
+VALID_EVENT_TYPES = {'Login', 'Logout', 'LevelComplete', 'InAppPurchase', 'SocialInteraction'}
+VALID_DEVICES = {'Android', 'iOS', 'PC'}
+# 固定类别的 Categorical 类型：不合法的值转换后编码为 -1，
+# 排序保证各工作进程得到相同的类别顺序
+VALID_EVENT_DTYPE = pd.CategoricalDtype(sorted(VALID_EVENT_TYPES))
+VALID_DEVICE_DTYPE = pd.CategoricalDtype(sorted(VALID_DEVICES))
+
+# 源列名到标准列名的映射
+COLUMN_MAPPING = {
+    'EventID': 'event_id',
+    'PlayerID': 'player_id',
+    'EventTimestamp': 'event_timestamp',
+    'EventType': 'event_type',
+    'EventDetails': 'event_details',
+    'DeviceType': 'device_type',
+    'Location': 'location'
+}
+
+# Parquet 输出参数：重复度高的列使用字典编码，约 100 万行一个 row group
+DICTIONARY_COLUMNS = ['player_id', 'event_type', 'device_type', 'location']
+ROW_GROUP_SIZE = 1_000_000
+
+REQUIRED_COLUMNS = ['event_id', 'player_id', 'event_timestamp', 'event_type']
+
+# 读取 CSV 时各标准列的 Arrow 类型：低基数列直接字典编码（转为 pandas Categorical），
+# 其余按字符串处理，时间戳保留为字符串，由 _clean_chunk 容错解析
+COLUMN_TYPES = {
+    name: pa.string() for name in COLUMN_MAPPING.values()
+}
+COLUMN_TYPES['event_type'] = pa.dictionary(pa.int32(), pa.string())
+COLUMN_TYPES['device_type'] = pa.dictionary(pa.int32(), pa.string())
+
+
+def _to_valid_category(col, dtype):
+    """
+    转为 Categorical 并仅对类别标签去除首尾空白，再映射到固定的合法类别，
+    字符串操作只作用于少量唯一值而非每一行
+    """
+    col = col.astype('category')
+    stripped = col.cat.categories.str.strip()
+    if stripped.is_unique:
+        col = col.cat.rename_categories(stripped)
+    else:
+        # 去空白后标签重复（如 'PC' 与 ' PC'），退回逐行处理
+        col = col.astype(object).str.strip()
+    return col.astype(dtype)
+
+
+def _normalize_id(col):
+    """
+    ID 列去除首尾空白并转大写：直接在 Arrow 字符串数组上计算，
+    避免两次 .str 调用各自生成中间 Series
+    """
+    return pd.arrays.ArrowStringArray(pc.utf8_upper(pc.utf8_trim_whitespace(pa.array(col))))
+
+
+def _clean_chunk(df):
+    """
+    对单块数据进行清洗（纯函数，供工作进程调用），列名读取时已标准化：
+      1. 补齐可选列
+      2. 去除完全重复行
+      3. 删除关键字段空值行
+      4. 过滤不合法的事件/设备类型
+      5. 解析时间戳并生成日期、小时列
+    :return: (清洗前行数, 清洗后的 DataFrame)
+    """
+    before = len(df)
+    # 填充可能缺失的 event_details 列
+    if 'event_details' not in df:
+        df['event_details'] = ''
+    # 去重、删除缺失
+    df = df.drop_duplicates().dropna(subset=REQUIRED_COLUMNS)
+    # 文本字段统一格式
+    df['event_id'] = _normalize_id(df['event_id'])
+    df['player_id'] = _normalize_id(df['player_id'])
+    # 低基数列转为固定类别的 Categorical，转换即完成合法性校验
+    df['event_type'] = _to_valid_category(df['event_type'], VALID_EVENT_DTYPE)
+    # device_type 可能不存在，则填充 Unknown；已是字符串/类别类型时无需逐行 astype(str)
+    device = df.get('device_type')
+    if device is None:
+        device = pd.Series('Unknown', index=df.index)
+    elif not (isinstance(device.dtype, pd.CategoricalDtype) or pd.api.types.is_string_dtype(device)):
+        device = device.astype(str)
+    df['device_type'] = _to_valid_category(device, VALID_DEVICE_DTYPE)
+    # 仅保留有效事件和设备（不合法值的编码为 -1）
+    df = df[(df['event_type'].cat.codes >= 0) & (df['device_type'].cat.codes >= 0)]
+    # 按固定格式解析时间戳（走向量化 C 解析器），忽略无法解析的
+    df['event_timestamp'] = pd.to_datetime(
+        df['event_timestamp'], format=TIMESTAMP_FORMAT, errors='coerce', cache=True
+    )
+    df = df.dropna(subset=['event_timestamp'])
+    # 提取日期和小时，用于后续分析
+    df['event_date'] = df['event_timestamp'].values.astype('datetime64[D]')
+    df['event_hour'] = df['event_timestamp'].dt.hour
+    return before, df
+
+
+def _bounded(iterable, slots, stop):
+    """
+    限制预读数量：每取出一块需占用一个名额，
+    避免进程池的任务线程把整个文件读入内存；stop 置位后立即结束
+    """
+    for item in iterable:
+        while not slots.acquire(timeout=0.5):
+            if stop.is_set():
+                return
+        yield item
+
+
 class DataCleaner:
     """
     数据清洗工具：
@@ -14,116 +134,138 @@ class DataCleaner:
       - 去重与空值处理
       - 事件类型与设备类型过滤
       - 时间戳解析并提取日期/小时
+      - 多进程并行清洗各数据块
+      - 以 Parquet 格式流式写出，按固定行数划分 row group
     """
 
-    # 定义允许的事件类型和设备类型集合
-    VALID_EVENT_TYPES = {'Login', 'Logout', 'LevelComplete', 'InAppPurchase', 'SocialInteraction'}
-    VALID_DEVICES = {'Android', 'iOS', 'PC'}
+    VALID_EVENT_TYPES = VALID_EVENT_TYPES
+    VALID_DEVICES = VALID_DEVICES
 
-    def __init__(self, src, dst, chunk_size=50000):
+    def __init__(self, src, dst, block_size=16 << 20, workers=None):
         """
         初始化清洗器
         :param src: 源 CSV 文件路径
-        :param dst: 输出 CSV 文件路径
-        :param chunk_size: 分块读取行数
+        :param dst: 输出 Parquet 文件路径
+        :param block_size: 每块读取的字节数，默认 16MB
+        :param workers: 清洗进程数，默认使用全部 CPU 核心
         """
         self.src = src
         self.dst = dst
-        self.chunk_size = chunk_size
+        self.block_size = block_size
+        self.workers = workers or os.cpu_count() or 1
         # 用于统计总行数和保留行数
         self.stats = {'total': 0, 'kept': 0}
 
-    def _standardize(self, df):
+    def _resolve_columns(self):
         """
-        标准化列名：将不同命名方式统一为小写下划线
+        读取表头，确定需要读取的源列及其标准列名（小写下划线），
         并确保必需列存在
+        :return: {源列名: 标准列名}
         """
-        mapping = {
-            'EventID': 'event_id',
-            'PlayerID': 'player_id',
-            'EventTimestamp': 'event_timestamp',
-            'EventType': 'event_type',
-            'EventDetails': 'event_details',
-            'DeviceType': 'device_type',
-            'Location': 'location'
-        }
-        df = df.rename(columns=mapping)
+        with open(self.src, newline='', encoding='utf-8-sig') as f:
+            header = next(csv.reader(f), [])
+        columns = {}
+        for name in header:
+            std = COLUMN_MAPPING.get(name, name)
+            if std in COLUMN_TYPES:
+                columns[name] = std
         # 检查必需列是否齐全
-        for col in ['event_id','player_id','event_timestamp','event_type']:
-            if col not in df.columns:
+        for col in REQUIRED_COLUMNS:
+            if col not in columns.values():
                 raise KeyError(f"缺少必需列: {col}")
-        # 填充可能缺失的 event_details 列
-        if 'event_details' not in df:
-            df['event_details'] = ''
-        return df
+        return columns
 
-    def _clean(self, df):
+    def _read_chunks(self, columns):
         """
-        对单块数据进行清洗：
-          1. 标准化列名
-          2. 去除完全重复行
-          3. 删除关键字段空值行
-          4. 过滤不合法的事件/设备类型
-          5. 解析时间戳并生成日期、小时列
+        使用 PyArrow 流式读取 CSV（内部多线程解析），只解析需要的列并直接指定类型，
+        逐个 record batch 转为使用标准列名的 DataFrame；文本列使用 Arrow 字符串类型
         """
-        before = len(df)
-        # 标准化并去重、删除缺失
-        df = (
-            df.pipe(self._standardize)
-              .drop_duplicates()
-              .dropna(subset=['event_id','player_id','event_timestamp','event_type'])
+        reader = pa_csv.open_csv(
+            self.src,
+            read_options=pa_csv.ReadOptions(block_size=self.block_size),
+            convert_options=pa_csv.ConvertOptions(
+                include_columns=list(columns),
+                column_types={name: COLUMN_TYPES[std] for name, std in columns.items()},
+                # 与 pandas 一致：空字符串视为缺失值
+                strings_can_be_null=True
+            )
         )
-        # 文本字段统一格式
-        df['event_id'] = df['event_id'].str.upper().str.strip()
-        df['player_id'] = df['player_id'].str.upper().str.strip()
-        df['event_type'] = df['event_type'].str.strip()
-        # device_type 可能不存在，则填充 Unknown
-        df['device_type'] = df.get('device_type', 'Unknown').astype(str).str.strip()
-        # 仅保留有效事件和设备
-        df = df[df['event_type'].isin(self.VALID_EVENT_TYPES)]
-        df = df[df['device_type'].isin(self.VALID_DEVICES)]
-        # 解析时间戳，忽略无法解析的
-        df['event_timestamp'] = pd.to_datetime(df['event_timestamp'], errors='coerce')
-        df = df.dropna(subset=['event_timestamp'])
-        # 提取日期和小时，用于后续分析
-        df['event_date'] = df['event_timestamp'].dt.date
-        df['event_hour'] = df['event_timestamp'].dt.hour
-
-        kept = len(df)
-        # 更新统计
-        self.stats['total'] += before
-        self.stats['kept'] += kept
-        logger.info(f"清洗块: {before}→{kept} 行保留")
-        return df
+        names = list(columns.values())
+        types_mapper = {pa.string(): pd.StringDtype('pyarrow')}.get
+        for batch in reader:
+            df = batch.to_pandas(types_mapper=types_mapper)
+            df.columns = names
+            yield df
+
+    @staticmethod
+    def _write_row_groups(writer, table):
+        """
+        按 ROW_GROUP_SIZE 写出完整的 row group，返回剩余不足一组的数据
+        """
+        while table.num_rows >= ROW_GROUP_SIZE:
+            writer.write_table(table.slice(0, ROW_GROUP_SIZE))
+            table = table.slice(ROW_GROUP_SIZE)
+        return table
 
     def run(self):
         """
         主流程：
           - 检查源文件
-          - 分块读取并清洗
-          - 输出到目标文件
+          - 分块读取，交由进程池并行清洗
+          - 主进程顺序写出到目标文件
           - 打印总体统计
         """
         if not os.path.exists(self.src):
             logger.error(f"源文件不存在: {self.src}")
             return
+        columns = self._resolve_columns()
         # 删除旧文件
         if os.path.exists(self.dst):
             os.remove(self.dst)
 
-        header = True
+        writer = None
+        schema = None
+        # 尚未凑满一个 row group 的数据
+        pending, pending_rows = [], 0
         start = time.time()
-        # 分块读取并清洗
-        for chunk in pd.read_csv(self.src, chunksize=self.chunk_size):
-            clean_chunk = self._clean(chunk)
-            if not clean_chunk.empty:
-                clean_chunk.to_csv(
-                    self.dst,
-                    mode='w' if header else 'a',
-                    index=False,
-                    header=header
-                )
-                header = False
+        # 每个工作进程最多预读两块
+        slots = threading.BoundedSemaphore(self.workers * 2)
+        stop = threading.Event()
+        chunks = _bounded(self._read_chunks(columns), slots, stop)
+        # maxtasksperchild 定期重启工作进程，限制内存增长
+        with mp.Pool(self.workers, maxtasksperchild=4) as pool:
+            try:
+                for before, clean_chunk in pool.imap_unordered(_clean_chunk, chunks, chunksize=1):
+                    slots.release()
+                    kept = len(clean_chunk)
+                    # 更新统计
+                    self.stats['total'] += before
+                    self.stats['kept'] += kept
+                    logger.info(f"清洗块: {before}→{kept} 行保留")
+                    if clean_chunk.empty:
+                        continue
+                    # 以首个非空块确定 schema，后续块按同一 schema 转换
+                    table = pa.Table.from_pandas(clean_chunk, schema=schema, preserve_index=False)
+                    if writer is None:
+                        schema = table.schema
+                        writer = pq.ParquetWriter(
+                            self.dst,
+                            schema,
+                            compression='zstd',
+                            compression_level=3,
+                            use_dictionary=[c for c in DICTIONARY_COLUMNS if c in schema.names]
+                        )
+                    pending.append(table)
+                    pending_rows += table.num_rows
+                    if pending_rows >= ROW_GROUP_SIZE:
+                        rest = self._write_row_groups(writer, pa.concat_tables(pending))
+                        pending, pending_rows = [rest], rest.num_rows
+                if pending_rows:
+                    writer.write_table(pa.concat_tables(pending))
+            finally:
+                stop.set()
+                if writer is not None:
+                    writer.close()
         elapsed = time.time() - start
         kept, total = self.stats['kept'], self.stats['total']
         logger.info(
@@ -133,5 +275,5 @@ class DataCleaner:
 if __name__ == '__main__':
     # 从用户输入获取文件路径，提供默认值
     src = input("输入源CSV路径 (默认: game_events.csv): ") or "game_events.csv"
-    dst = input("输入输出CSV路径 (默认: cleaned_game_events.csv): ") or "cleaned_game_events.csv"
+    dst = input("输入输出Parquet路径 (默认: cleaned_game_events.parquet): ") or "cleaned_game_events.parquet"
     DataCleaner(src, dst).run()
@@ -1,15 +1,21 @@
 import streamlit as st
 import pandas as pd
 import sqlite3  # SQLite connection
+import os
+import pyarrow.parquet as pq
 import plotly.express as px
 import numpy as np
 from datetime import datetime
+from pathlib import Path
 import warnings
 import re
 
 # 忽略警告信息
 warnings.filterwarnings('ignore')
 
+# 内购金额解析正则，模块加载时编译一次；金额只含 ASCII 字符，re.ASCII 省去 Unicode 匹配表
+AMOUNT_PATTERN = re.compile(r"Amount:\s*\$(\d+\.?\d*)", re.ASCII)
+
 # 页面基本配置
 st.set_page_config(
     page_title="游戏数据分析仪表板",
@@ -17,106 +23,267 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# 只读分析场景下的 SQLite 读优化参数：内存映射、256MB 页缓存、临时表放内存
+SQLITE_PRAGMAS = (
+    "PRAGMA mmap_size=30000000000",
+    "PRAGMA cache_size=-262144",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA synchronous=OFF",
+)
+
+def connect_readonly(db_path):
+    """
+    以只读模式打开 SQLite 数据库并应用读优化 PRAGMA
+    """
+    conn = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True)
+    for pragma in SQLITE_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+@st.cache_data(show_spinner=False)
+def resolve_schema(db_path, mtime):
+    """
+    探测事件表及列信息，构建统一列名的查询语句
+    按 (db_path, mtime) 缓存，避免每次重跑都查询 SQLite 元数据；
+    数据库文件被改写后自动失效，"重新加载"时的 resolve_schema.clear() 仅作兜底
+    :return: (查询语句, 表名)，找不到事件表时返回 (None, None)
+    """
+    with connect_readonly(db_path) as conn:
+        tables = pd.read_sql_query(
+            "SELECT name FROM sqlite_master WHERE type='table'", conn
+        )
+        # 判断表名
+        if 'events' in tables['name'].values:
+            table = 'events'
+        elif 'cleaned_events' in tables['name'].values:
+            table = 'cleaned_events'
+        else:
+            return None, None
+
+        # 获取列信息
+        cols_info = pd.read_sql_query(f"PRAGMA table_info({table})", conn)
+        cols = frozenset(cols_info['name'])
+
+        # 构建 SELECT 字段并重命名
+        select = []
+        # 必需字段映射
+        required = {
+            'event_id': ['event_id', 'EventID'],
+            'player_id': ['player_id', 'PlayerID'],
+            'event_timestamp': ['event_timestamp', 'EventTimestamp'],
+            'event_type': ['event_type', 'EventType']
+        }
+        for alias, opts in required.items():
+            for c in opts:
+                if c in cols:
+                    select.append(f"{c} AS {alias}")
+                    break
+
+        # 可选字段处理
+        optional = {
+            'event_details': ['event_details', 'EventDetails'],
+            'device_type': ['device_type', 'DeviceType'],
+            'location': ['location', 'Location'],
+            'purchase_amount': ['purchase_amount'],
+            'event_date': [],
+            'event_hour': []
+        }
+        for alias, opts in optional.items():
+            found = False
+            for c in opts:
+                if c in cols:
+                    select.append(f"{c} AS {alias}")
+                    found = True
+                    break
+            if not found:
+                # 默认生成
+                if alias == 'event_details':
+                    select.append("'' AS event_details")
+                elif alias == 'device_type':
+                    select.append("'Unknown' AS device_type")
+                elif alias == 'location':
+                    select.append("'Unknown' AS location")
+                elif alias == 'purchase_amount':
+                    select.append("0.0 AS purchase_amount")
+                elif alias == 'event_date':
+                    select.append("DATE(event_timestamp) AS event_date")
+                elif alias == 'event_hour':
+                    select.append("CAST(strftime('%H', event_timestamp) AS INTEGER) AS event_hour")
+
+        query = f"SELECT {', '.join(select)} FROM {table} WHERE event_timestamp IS NOT NULL"
+    return query, table
+
+# 在 SQLite 中完成聚合的指标查询，{events} 替换为 resolve_schema 生成的统一列名查询
+METRIC_QUERIES = {
+    'dau': """
+        SELECT DATE(event_date) AS date, COUNT(DISTINCT player_id) AS dau
+        FROM ({events})
+        GROUP BY DATE(event_date)
+    """,
+    'duration': """
+        SELECT date, AVG(MAX(minutes, 1)) AS avg_duration
+        FROM (
+            SELECT DATE(event_date) AS date,
+                   (julianday(MAX(event_timestamp)) - julianday(MIN(event_timestamp))) * 1440 AS minutes
+            FROM ({events})
+            GROUP BY player_id, DATE(event_date)
+            HAVING COUNT(*) > 1
+        )
+        GROUP BY date
+    """,
+    'revenue': """
+        SELECT DATE(event_date) AS date,
+               SUM(CAST(substr(event_details, instr(event_details, '$') + 1) AS REAL)) AS revenue
+        FROM ({events})
+        WHERE event_type = 'InAppPurchase'
+        GROUP BY DATE(event_date)
+    """,
+    'social': """
+        SELECT s.date, CAST(s.social_count AS REAL) / t.sessions AS social_per_session
+        FROM (
+            SELECT DATE(event_date) AS date, COUNT(*) AS social_count
+            FROM ({events})
+            WHERE event_type = 'SocialInteraction'
+            GROUP BY DATE(event_date)
+        ) s
+        JOIN (
+            SELECT date, COUNT(*) AS sessions
+            FROM (
+                SELECT DATE(event_date) AS date
+                FROM ({events})
+                GROUP BY player_id, DATE(event_date)
+                HAVING COUNT(*) > 1
+            )
+            GROUP BY date
+        ) t ON s.date = t.date
+    """,
+}
+
+def _query_metric(db_path, mtime, name):
+    """
+    执行单个聚合查询，只取回按天汇总后的少量行
+    """
+    query, _ = resolve_schema(db_path, mtime)
+    if query is None:
+        raise ValueError("数据库中找不到事件表")
+    with connect_readonly(db_path) as conn:
+        result = pd.read_sql_query(METRIC_QUERIES[name].format(events=query), conn)
+    result['date'] = pd.to_datetime(result['date'], errors='coerce')
+    return result
+
+# 以下指标按 (db_path, mtime) 缓存：mtime 仅作缓存键，数据库文件更新后自动失效
+@st.cache_data(show_spinner=False)
+def load_dau(db_path, mtime):
+    """
+    每日活跃用户数
+    """
+    return _query_metric(db_path, mtime, 'dau')
+
+@st.cache_data(show_spinner=False)
+def load_duration(db_path, mtime):
+    """
+    每日平均会话时长（分钟）
+    """
+    return _query_metric(db_path, mtime, 'duration')
+
+@st.cache_data(show_spinner=False)
+def load_revenue(db_path, mtime):
+    """
+    每日收入
+    """
+    return _query_metric(db_path, mtime, 'revenue')
+
+@st.cache_data(show_spinner=False)
+def load_social(db_path, mtime):
+    """
+    每日社交互动/会话
+    """
+    return _query_metric(db_path, mtime, 'social')
+
+METRIC_LOADERS = {
+    'dau': load_dau,
+    'duration': load_duration,
+    'revenue': load_revenue,
+    'social': load_social,
+}
+
 class GameAnalyticsDashboard:
     """
     游戏数据分析仪表板
-    从 SQLite 加载数据，计算关键指标，并使用 Plotly 可视化
+    从 SQLite 或 ETL 输出的 Parquet 文件加载数据，计算关键指标，并使用 Plotly 可视化
     """
-    def __init__(self, db_path):
+    def __init__(self, db_path, explore_raw=False):
+        """
+        :param db_path: SQLite 数据库或 Parquet 文件路径
+        :param explore_raw: 是否全量加载原始事件（SQLite 默认只在库内聚合）
+        """
         self.db_path = db_path
+        self.explore_raw = explore_raw
         self.data = None
 
     def load_data(self):
         """
         从 SQLite 数据库中加载事件表
-        自动支持 events 或 cleaned_events 表
+        自动支持 events 或 cleaned_events 表；.parquet 文件直接读取
+        未开启 explore_raw 时只解析表结构，指标由 query_metrics 在库内聚合
         """
+        if self.db_path.endswith('.parquet'):
+            return self._load_parquet()
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                tables = pd.read_sql_query(
-                    "SELECT name FROM sqlite_master WHERE type='table'", conn
-                )
-                # 判断表名
-                if 'events' in tables['name'].values:
-                    table = 'events'
-                elif 'cleaned_events' in tables['name'].values:
-                    table = 'cleaned_events'
-                else:
-                    st.error("数据库中找不到事件表")
-                    return False
-
-                # 获取列信息
-                cols_info = pd.read_sql_query(f"PRAGMA table_info({table})", conn)
-                cols = cols_info['name'].tolist()
-
-                # 构建 SELECT 字段并重命名
-                select = []
-                # 必需字段映射
-                required = {
-                    'event_id': ['event_id', 'EventID'],
-                    'player_id': ['player_id', 'PlayerID'],
-                    'event_timestamp': ['event_timestamp', 'EventTimestamp'],
-                    'event_type': ['event_type', 'EventType']
-                }
-                for alias, opts in required.items():
-                    for c in opts:
-                        if c in cols:
-                            select.append(f"{c} AS {alias}")
-                            break
-
-                # 可选字段处理
-                optional = {
-                    'event_details': ['event_details', 'EventDetails'],
-                    'device_type': ['device_type', 'DeviceType'],
-                    'location': ['location', 'Location'],
-                    'purchase_amount': ['purchase_amount'],
-                    'event_date': [],
-                    'event_hour': []
-                }
-                for alias, opts in optional.items():
-                    found = False
-                    for c in opts:
-                        if c in cols:
-                            select.append(f"{c} AS {alias}")
-                            found = True
-                            break
-                    if not found:
-                        # 默认生成
-                        if alias == 'event_details':
-                            select.append("'' AS event_details")
-                        elif alias == 'device_type':
-                            select.append("'Unknown' AS device_type")
-                        elif alias == 'location':
-                            select.append("'Unknown' AS location")
-                        elif alias == 'purchase_amount':
-                            select.append("0.0 AS purchase_amount")
-                        elif alias == 'event_date':
-                            select.append("DATE(event_timestamp) AS event_date")
-                        elif alias == 'event_hour':
-                            select.append("CAST(strftime('%H', event_timestamp) AS INTEGER) AS event_hour")
-
-                query = f"SELECT {', '.join(select)} FROM {table} WHERE event_timestamp IS NOT NULL"
+            query, table = resolve_schema(self.db_path, os.path.getmtime(self.db_path))
+            if query is None:
+                st.error("数据库中找不到事件表")
+                return False
+            if not self.explore_raw:
+                return True
+            with connect_readonly(self.db_path) as conn:
                 self.data = pd.read_sql_query(query, conn)
-                # 转换时间类型
-                self.data['event_timestamp'] = pd.to_datetime(self.data['event_timestamp'], errors='coerce')
-                self.data['event_date'] = pd.to_datetime(self.data['event_date'], errors='coerce')
+            # 转换时间类型
+            self.data['event_timestamp'] = pd.to_datetime(self.data['event_timestamp'], errors='coerce')
+            self.data['event_date'] = pd.to_datetime(self.data['event_date'], errors='coerce')
 
-                return True
+            return True
         except Exception as e:
             st.error(f"加载数据失败: {e}")
             return False
 
+    def _load_parquet(self):
+        """
+        从 ETL 输出的 Parquet 文件加载事件数据
+        """
+        try:
+            self.data = pq.read_table(self.db_path).to_pandas()
+        except Exception as e:
+            st.error(f"加载数据失败: {e}")
+            return False
+        # ETL 已解析时间戳，这里仅统一日期列类型
+        self.data['event_date'] = pd.to_datetime(self.data['event_date'], errors='coerce')
+        return True
+
     def calculate_session_duration(self):
         """
         计算每个玩家每天的会话时长（分钟）
         """
-        # 按玩家和日期计算最早和最晚事件
-        df = self.data.copy()
-        df['date_only'] = df['event_date'].dt.date
-        stats = df.groupby(['player_id', 'date_only'])['event_timestamp']\
-                  .agg(['min', 'max', 'count']).reset_index()
-        stats = stats[stats['count'] > 1]
-        stats['duration_minutes'] = (stats['max'] - stats['min']).dt.total_seconds() / 60
+        # 只取所需三列按玩家、日期、时间排序，每组首行即最早事件、末行即最晚事件
+        # 日期键用 floor('D')，保持 datetime64 类型，比 Python date 对象更快且可与 event_date 直接合并
+        df = pd.DataFrame({
+            'player_id': self.data['player_id'],
+            'date_only': self.data['event_date'].dt.floor('D'),
+            'event_timestamp': self.data['event_timestamp']
+        }).dropna().sort_values(['player_id', 'date_only', 'event_timestamp'])
+        key = df[['player_id', 'date_only']]
+        first = ~key.duplicated(keep='first')
+        last = ~key.duplicated(keep='last')
+        # 既是首行又是末行的组只有一条事件，不计为会话
+        single = first & last
+        first, last = first & ~single, last & ~single
+        stats = pd.DataFrame({
+            'player_id': df.loc[first, 'player_id'].values,
+            'date_only': df.loc[first, 'date_only'].values,
+            'min_ts': df.loc[first, 'event_timestamp'].values,
+            'max_ts': df.loc[last, 'event_timestamp'].values
+        })
+        stats['duration_minutes'] = (stats['max_ts'] - stats['min_ts']).dt.total_seconds() / 60
         stats['duration_minutes'] = stats['duration_minutes'].clip(lower=1)
         return stats[['player_id', 'date_only', 'duration_minutes']]
 
@@ -138,8 +305,9 @@ class GameAnalyticsDashboard:
         avg_dur.columns = ['date', 'avg_duration']
         # 3. 收入
         mask = df['event_type'] == 'InAppPurchase'
-        df.loc[mask, 'purchase_amount'] = df.loc[mask, 'event_details']\
-            .apply(lambda x: float(re.search(r"Amount:\s*\$(\d+\.?\d*)", x).group(1)) if pd.notna(x) and re.search(r"Amount:\s*\$(\d+\.?\d*)", x) else 0)
+        # 向量化提取金额，无法解析的记为 0
+        amounts = df.loc[mask, 'event_details'].str.extract(AMOUNT_PATTERN, expand=False)
+        df.loc[mask, 'purchase_amount'] = pd.to_numeric(amounts, errors='coerce').fillna(0.0)
         revenue = df[mask].groupby('event_date')['purchase_amount'].sum().reset_index()
         revenue.columns = ['date', 'revenue']
         # 4. 社交互动/会话
@@ -150,6 +318,21 @@ class GameAnalyticsDashboard:
         social_per = social_per[['event_date', 'social_per_session']].rename(columns={'event_date':'date'})
         return {'dau': dau, 'duration': avg_dur, 'revenue': revenue, 'social': social_per}
 
+    def query_metrics(self):
+        """
+        在 SQLite 中聚合核心指标，返回结构与 calculate_metrics 相同
+        """
+        mtime = os.path.getmtime(self.db_path)
+        return {name: load(self.db_path, mtime) for name, load in METRIC_LOADERS.items()}
+
+    def get_metrics(self):
+        """
+        已加载原始数据时用 pandas 计算，否则直接在 SQLite 中聚合
+        """
+        if self.data is not None:
+            return self.calculate_metrics()
+        return self.query_metrics()
+
     # 绘图函数略，保留原实现即可
 
 # 主流程
@@ -157,23 +340,40 @@ st.title("游戏数据分析仪表板")
 if 'dashboard' not in st.session_state:
     st.session_state['dashboard'] = None
 
-db_file = st.sidebar.text_input("数据库路径", value="game_data.db")
-if st.sidebar.button("加载数据"):
-    dash = GameAnalyticsDashboard(db_file)
+db_file = st.sidebar.text_input("数据路径 (SQLite/Parquet)", value="game_data.db")
+load_clicked = st.sidebar.button("加载数据")
+reload_clicked = st.sidebar.button("重新加载")
+explore_raw = st.sidebar.checkbox("浏览原始数据（全量加载）")
+if reload_clicked:
+    # 数据库结构或内容可能已变化，清除缓存的表结构和指标
+    resolve_schema.clear()
+    for load in METRIC_LOADERS.values():
+        load.clear()
+if load_clicked or reload_clicked:
+    dash = GameAnalyticsDashboard(db_file, explore_raw)
     if dash.load_data():
         st.session_state['dashboard'] = dash
         st.sidebar.success("数据加载成功")
 
 if st.session_state['dashboard']:
-    metrics = st.session_state['dashboard'].calculate_metrics()
-    st.subheader("每日活跃用户数")
-    st.line_chart(metrics['dau'].set_index('date'))
-    st.subheader("平均会话时长 (分钟)")
-    st.line_chart(metrics['duration'].set_index('date'))
-    st.subheader("每日收入 (元)")
-    st.bar_chart(metrics['revenue'].set_index('date'))
-    st.subheader("社交互动/会话")
-    st.line_chart(metrics['social'].set_index('date'))
+    dash = st.session_state['dashboard']
+    try:
+        metrics = dash.get_metrics()
+    except Exception as e:
+        st.error(f"计算指标失败: {e}")
+        metrics = None
+    if metrics is not None:
+        st.subheader("每日活跃用户数")
+        st.line_chart(metrics['dau'].set_index('date'))
+        st.subheader("平均会话时长 (分钟)")
+        st.line_chart(metrics['duration'].set_index('date'))
+        st.subheader("每日收入 (元)")
+        st.bar_chart(metrics['revenue'].set_index('date'))
+        st.subheader("社交互动/会话")
+        st.line_chart(metrics['social'].set_index('date'))
+    if dash.data is not None:
+        st.subheader("原始数据")
+        st.dataframe(dash.data.head(1000))
 
 else:
     st.info("请在侧边栏加载数据后查看分析")
@@ -1,71 +1,112 @@
 import pandas as pd
-import random
+import numpy as np
 import csv
-import gc
+import io
 import os
 import time
-from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
 
 # 配置
 NUM_PLAYERS = 100_000
 SIM_DAYS = 180
 MIN_EVENTS = 50
 MAX_EVENTS = 200
+BATCH_SIZE = 1000
+SEED = 42
 EVENT_TYPES = ["LevelComplete", "InAppPurchase", "SocialInteraction"]
 COUNTRIES = ["USA", "China", "Singapore", "Brazil", "Japan", "Germany", "India", "UK", "France", "Canada"]
 DEVICES = ["Android", "iOS", "PC"]
-random.seed(42)
+AMOUNTS = np.array([0.99, 2.99, 4.99, 9.99, 19.99, 49.99, 99.99])
+SOCIAL_ACTIONS = np.array(["JoinGuild", "SendMessage", "AddFriend", "ShareScore"])
+SIM_START = np.datetime64("2023-01-01T00:00:00", "s")
+HEADER = ["event_id","player_id","timestamp","type","details","device","country"]
 
-def gen_event_details(t):
-    if t == "LevelComplete":
-        return f"Level:{random.randint(1,100)},Score:{random.randint(1000,50000)}"
-    if t == "InAppPurchase":
-        return f"Amount:${random.choice([0.99,2.99,4.99,9.99,19.99,49.99,99.99])}"
-    if t == "SocialInteraction":
-        return f"Action:{random.choice(['JoinGuild','SendMessage','AddFriend','ShareScore'])}"
-    return ""
+def gen_event_details(etypes, rng):
+    # 按事件类型分组整列生成详情，Login/Logout 等其他类型为空
+    details = np.zeros(len(etypes), dtype="U32")
+    idx = np.flatnonzero(etypes == "LevelComplete")
+    levels = rng.integers(1, 100, size=len(idx), endpoint=True).astype(str)
+    scores = rng.integers(1000, 50000, size=len(idx), endpoint=True).astype(str)
+    details[idx] = np.char.add(np.char.add("Level:", levels), np.char.add(",Score:", scores))
+    idx = np.flatnonzero(etypes == "InAppPurchase")
+    details[idx] = np.char.mod("Amount:$%.2f", rng.choice(AMOUNTS, size=len(idx)))
+    idx = np.flatnonzero(etypes == "SocialInteraction")
+    details[idx] = np.char.add("Action:", rng.choice(SOCIAL_ACTIONS, size=len(idx)))
+    return details
 
-def gen_player_events(pid):
-    n = random.randint(MIN_EVENTS, MAX_EVENTS)
+def gen_player_events(n, rng):
+    # 一次性生成并排序全部事件时间（秒偏移）
     max_s = SIM_DAYS * 86400
-    times = sorted(random.randint(0, max_s) for _ in range(n))
-    events = []
-    for i, ts in enumerate(times):
-        if i == 0:
-            et = "Login"
-        elif i == n - 1:
-            et = "Logout"
-        else:
-            et = random.choice(EVENT_TYPES)
-        events.append((pid, ts, et, gen_event_details(et)))
-    return events
+    times = np.sort(rng.integers(0, max_s, size=n, endpoint=True))
+    # 首尾固定为登录/登出，中间随机抽取
+    etypes = np.concatenate((["Login"], rng.choice(EVENT_TYPES, size=n - 2), ["Logout"]))
+    details = gen_event_details(etypes, rng)
+    return times, etypes, details
+
+def format_times(times):
+    # 秒偏移整列转为 "YYYY-MM-DD HH:MM:SS" 字符串数组
+    stamps = np.datetime_as_string(SIM_START + times.astype("timedelta64[s]"), unit="s")
+    return np.char.replace(stamps, "T", " ").astype("U19")
+
+def gen_batch(lo, hi, counts, first_eid, seed):
+    # 在工作进程中生成 [lo, hi) 号玩家的事件，返回 UTF-8 编码的 CSV 片段
+    # seed 为该批独立的 SeedSequence 子序列，结果与调度顺序无关
+    rng = np.random.default_rng(seed)
+    pids = [f"P{100000+i}" for i in range(lo, hi)]
+    devs = rng.choice(DEVICES, size=hi - lo)
+    locs = rng.choice(COUNTRIES, size=hi - lo)
+    times, etypes, details = [], [], []
+    for n in counts:
+        ts, et, det = gen_player_events(n, rng)
+        times.append(ts)
+        etypes.append(et)
+        details.append(det)
+    # 按列拼接整批数据，玩家级字段按事件数展开
+    total = int(np.sum(counts))
+    eids = np.char.add("E", np.arange(first_eid, first_eid + total).astype(str))
+    columns = (
+        eids,
+        np.repeat(pids, counts),
+        format_times(np.concatenate(times)),
+        np.concatenate(etypes),
+        np.concatenate(details),
+        np.repeat(devs, counts),
+        np.repeat(locs, counts),
+    )
+    # writerows 在 C 层循环写出整批行
+    buf = io.StringIO(newline="")
+    csv.writer(buf).writerows(zip(*columns))
+    return buf.getvalue().encode("utf-8")
 
 def simulate(outfile="game_events.csv"):
     # 删除旧文件
     if os.path.exists(outfile):
         os.remove(outfile)
-    f = open(outfile, "w", newline="", encoding="utf-8")
-    w = csv.writer(f)
-    w.writerow(["event_id","player_id","timestamp","type","details","device","country"])
 
-    counter = 0
+    los = list(range(0, NUM_PLAYERS, BATCH_SIZE))
+    his = [min(lo + BATCH_SIZE, NUM_PLAYERS) for lo in los]
+    # 从同一 SeedSequence 派生互不重叠的随机流：一个用于事件数，其余每批一个
+    counts_seed, *batch_seeds = np.random.SeedSequence(SEED).spawn(1 + len(los))
+
+    # 预先抽取每个玩家的事件数，由此确定各批次的事件编号起点
+    counts = np.random.default_rng(counts_seed).integers(MIN_EVENTS, MAX_EVENTS, size=NUM_PLAYERS, endpoint=True)
+    first_eids = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
     start = time.time()
-    for batch_start in range(0, NUM_PLAYERS, 1000):
-        batch_end = min(batch_start + 1000, NUM_PLAYERS)
-        for i in range(batch_start, batch_end):
-            pid = f"P{100000+i}"
-            dev = random.choice(DEVICES)
-            loc = random.choice(COUNTRIES)
-            for _, ts, et, det in gen_player_events(pid):
-                eid = f"E{counter}"
-                counter += 1
-                dt = (datetime(2023,1,1) + timedelta(seconds=ts))\
-                     .strftime("%Y-%m-%d %H:%M:%S")
-                w.writerow([eid, pid, dt, et, det, dev, loc])
-        gc.collect()
-        print(f"Processed players {batch_start}–{batch_end-1}")
-    f.close()
-    print(f"Done: {counter} events in {time.time()-start:.1f}s")
+    with open(outfile, "wb") as f, ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        f.write((",".join(HEADER) + "\r\n").encode("utf-8"))
+        # map 按提交顺序返回结果，保证输出顺序与单进程一致
+        chunks = executor.map(
+            gen_batch, los, his,
+            [counts[lo:hi] for lo, hi in zip(los, his)],
+            [int(first_eids[lo]) for lo in los],
+            batch_seeds,
+            chunksize=1
+        )
+        for lo, hi, chunk in zip(los, his, chunks):
+            f.write(chunk)
+            print(f"Processed players {lo}–{hi-1}")
+    print(f"Done: {int(counts.sum())} events in {time.time()-start:.1f}s")
 
 if __name__ == "__main__":
     simulate()